@@ -2,9 +2,9 @@ import os
 import sys
 import json
 from dotenv import load_dotenv
-from src.ocr_engine import extract_id_card_data, extract_resume_data
+from src.ocr_engine import extract_resume_data
 # We now use the updated extractor which handles ID data merging
-from src.extractor import extract_id_fields, extract_candidate_data
+from src.extractor import extract_id_card_and_fields, extract_candidate_data
 
 def main_v2():
     load_dotenv()
@@ -35,12 +35,9 @@ def main_v2():
     id_data = None
     if os.path.exists(id_card_path):
         print(f"\nProcessing ID Card: {id_card_path}")
-        # Now returns list of (bbox, text, prob)
-        ocr_results = extract_id_card_data(id_card_path) 
-        
-        # Apply regex logic
-        print("\nApplying Regex Extraction to ID Card Data...")
-        id_data = extract_id_fields(ocr_results)
+        # OCR + regex logic in one step
+        print("Applying Regex Extraction to ID Card Data...")
+        id_data = extract_id_card_and_fields(id_card_path)
     
     # Load Transcript
     transcript_path = os.path.join(base_dir, "inputs", "transcript.txt")
@@ -2,14 +2,14 @@ import streamlit as st
 import os
 import json
 import shutil
+import hashlib
+import threading
+import orjson
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
 from dotenv import load_dotenv
 
-# Import Backend Logic
-from src.ocr_engine import extract_id_card_data, extract_resume_data
-from src.extractor import extract_id_fields, extract_candidate_data
-from src.validator import validate_candidate_data
-from src.reporter import generate_report, generate_pdf_report
-
 # Load Env
 load_dotenv()
 if not os.getenv("GROQ_API_KEY"):
@@ -30,19 +30,98 @@ menu = st.sidebar.selectbox("Go to", ["Dashboard", "Onboarding Form", "HR Call T
 def save_uploaded_file(uploaded_file, filename):
     try:
         path = os.path.join(INPUTS_DIR, filename)
+        # Stream in 1MB chunks instead of materializing the whole upload via getbuffer()
+        uploaded_file.seek(0)
         with open(path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+            shutil.copyfileobj(uploaded_file, f, length=1 << 20)
         return path
     except Exception as e:
         st.error(f"Error saving file: {e}")
         return None
 
-def count_files(pattern):
-    count = 0
-    for file in os.listdir(INPUTS_DIR):
-        if pattern in file.lower():
-            count += 1
-    return count
+def file_digest(path):
+    """
+    SHA-256 of the file contents, used as the cache key for OCR results.
+    """
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+# OCR is CPU-bound; one worker process per document keeps the two runs on separate cores.
+# "spawn" avoids forking Streamlit's threads, and the pool is kept so each worker loads EasyOCR once.
+@st.cache_resource
+def get_ocr_pool():
+    return ProcessPoolExecutor(max_workers=2, mp_context=get_context("spawn"))
+
+# The script re-runs on every interaction, so the lock is a cached resource like the pool it guards
+@st.cache_resource
+def get_ocr_pool_lock():
+    return threading.Lock()
+
+def run_in_ocr_pool(fn, path, **kwargs):
+    pool = get_ocr_pool()
+    try:
+        return pool.submit(fn, path, **kwargs).result()
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed), which breaks the cached pool for good; replace it and retry once.
+        # Both in-flight OCR jobs land here together; only the first replaces the pool the other may already use.
+        with get_ocr_pool_lock():
+            if get_ocr_pool() is pool:
+                pool.shutdown(wait=False)
+                get_ocr_pool.clear()
+            pool = get_ocr_pool()
+        return pool.submit(fn, path, **kwargs).result()
+
+class UncachedOcrResult(Exception):
+    """
+    Carries an OCR error fallback out of a cached call; st.cache_data doesn't store results of calls that raise.
+    """
+    def __init__(self, result):
+        super().__init__("OCR returned its error fallback")
+        self.result = result
+
+def run_uncached_on_error(cached_fn, digest, path):
+    try:
+        return cached_fn(digest, path)
+    except UncachedOcrResult as e:
+        return e.result
+
+# OCR results are cached on file contents; the leading underscore keeps the path out of the hash.
+# Error fallbacks (e.g. a transient Poppler or model load failure) are not cached, so the next run retries.
+@st.cache_data(show_spinner=False)
+def cached_resume_ocr(digest, _path):
+    from src.ocr_engine import extract_resume_data, RESUME_FALLBACK_ERROR
+    resume_text = run_in_ocr_pool(extract_resume_data, _path)
+    if resume_text.startswith(RESUME_FALLBACK_ERROR):
+        raise UncachedOcrResult(resume_text)
+    return resume_text
+
+@st.cache_data(show_spinner=False)
+def cached_id_card_fields(digest, _path):
+    from src.ocr_engine import OcrError
+    from src.extractor import extract_id_card_and_fields
+    try:
+        return run_in_ocr_pool(extract_id_card_and_fields, _path, raise_errors=True)
+    except OcrError as e:
+        # Treated like a missing ID card for this run; a card that simply has no matches is still cached
+        print(e)
+        raise UncachedOcrResult(None)
+
+# Inputs are re-read only when the file changes; mtime is part of the cache key
+@st.cache_data(show_spinner=False)
+def read_text(path, mtime):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+@st.cache_data(show_spinner=False)
+def read_json(path, mtime):
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+# Dashboard re-renders on every widget event; rescan the inputs folder at most every 5 seconds
+@st.cache_data(ttl=5)
+def count_files(patterns):
+    files = [file.lower() for file in os.listdir(INPUTS_DIR)]
+    return {pattern: sum(1 for file in files if pattern in file) for pattern in patterns}
 
 # --- Menu 1: Dashboard ---
 if menu == "Dashboard":
@@ -52,9 +131,10 @@ if menu == "Dashboard":
     col1, col2, col3 = st.columns(3)
     
     # Simple Metrics based on file existence triggers
-    resumes_count = count_files("resume")
-    forms_count = count_files("form")
-    ids_count = count_files("card")
+    counts = count_files(("resume", "form", "card"))
+    resumes_count = counts["resume"]
+    forms_count = counts["form"]
+    ids_count = counts["card"]
     
     col1.metric("Total Resumes", f"{resumes_count}")
     col2.metric("Onboarding Forms", f"{forms_count}")
@@ -143,6 +223,11 @@ elif menu == "HR Call Transcripts":
 
 # --- Menu 4: Final Output ---
 elif menu == "Final Output":
+    # Backend Logic pulls in Torch/EasyOCR/ONNX, so only import it on the page that runs it
+    from src.extractor import stream_candidate_data, parse_golden_record
+    from src.validator import validate_candidate_data
+    from src.reporter import generate_report, generate_pdf_report
+
     st.title("✅ Validation Processing")
     
     if st.button("Process Everything"):
@@ -157,35 +242,31 @@ elif menu == "Final Output":
             form_path = os.path.join(INPUTS_DIR, "onboarding_form.json")
             transcript_path = os.path.join(INPUTS_DIR, "transcript.txt")
             
-            # 1. OCR Step
-            status.write("Running OCR on Documents...")
-            resume_text = ""
-            if os.path.exists(resume_path):
-                resume_text = extract_resume_data(resume_path)
-            
-            id_data = None
-            if os.path.exists(id_path):
-                ocr_results = extract_id_card_data(id_path)
-                status.write("Applying Regulatory Regex on ID...")
-                id_data = extract_id_fields(ocr_results)
-            
-            # 2. Reading Inputs
-            transcript_text = ""
-            if os.path.exists(transcript_path):
-                with open(transcript_path, "r") as f:
-                    transcript_text = f.read()
-            
-            form_data = None
-            if os.path.exists(form_path):
-                with open(form_path, "r") as f:
-                    form_data = json.load(f)
+            # 1. OCR Step + 2. Reading Inputs
+            # Resume and ID OCR are independent; the threads only dispatch them to the OCR worker processes
+            status.write("Running OCR and Regulatory Regex on Documents...")
+            with ThreadPoolExecutor(max_workers=4) as ex:
+                resume_future = ex.submit(run_uncached_on_error, cached_resume_ocr, file_digest(resume_path), resume_path) if os.path.exists(resume_path) else None
+                id_future = ex.submit(run_uncached_on_error, cached_id_card_fields, file_digest(id_path), id_path) if os.path.exists(id_path) else None
+                transcript_future = ex.submit(read_text, transcript_path, os.path.getmtime(transcript_path)) if os.path.exists(transcript_path) else None
+                form_future = ex.submit(read_json, form_path, os.path.getmtime(form_path)) if os.path.exists(form_path) else None
+
+                resume_text = resume_future.result() if resume_future else ""
+                # ID OCR and the regulatory regex run together in the worker
+                id_data = id_future.result() if id_future else None
+                transcript_text = transcript_future.result() if transcript_future else ""
+                form_data = form_future.result() if form_future else None
 
             # 3. KB Extraction
             status.write("Synthesizing Multimodal Knowledge Base...")
-            golden_record_str = extract_candidate_data(resume_text, transcript_text, id_data, form_data)
+            # Stream tokens so the user sees output at first-token latency; cleared once the JSON is complete
+            stream_box = st.empty()
+            with stream_box.container():
+                golden_record_str = st.write_stream(stream_candidate_data(resume_text, transcript_text, id_data, form_data))
+            stream_box.empty()
             try:
-                golden_record = json.loads(golden_record_str)
-            except json.JSONDecodeError:
+                golden_record = parse_golden_record(golden_record_str)
+            except orjson.JSONDecodeError:
                 status.update(label="Error Parsing JSON", state="error")
                 st.error("Failed to generate valid JSON from LLM.")
                 st.stop()
@@ -198,7 +279,7 @@ elif menu == "Final Output":
             # 5. Reporting
             status.write("Generating Recommendation Report...")
             # Legacy string report for Display
-            hr_report_summary = generate_report(json.dumps(validation_report))
+            hr_report_summary = generate_report(validation_report)
             
             # PDF Report for Download
             pdf_path = os.path.join(INPUTS_DIR, "validation_report.pdf")
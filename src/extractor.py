@@ -58,130 +58,243 @@
 import os
 import json
 import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import orjson
 from groq import Groq
 from dotenv import load_dotenv
+from src.ocr_engine import extract_id_card_data
 
 load_dotenv()
 
-def extract_id_fields(ocr_results):
+logger = logging.getLogger(__name__)
+
+# Golden Records keyed on the SHA-256 of the canonicalized inputs (most recent last)
+_golden_record_cache = OrderedDict()
+# Streamlit sessions share this module, so cache access is serialized
+_golden_record_lock = threading.Lock()
+_GOLDEN_RECORD_CACHE_SIZE = 64
+
+# Pattern: 12 digits, can have spaces (Aadhar)
+AADHAR_PATTERN = r'[2-9][0-9]{3}\s[0-9]{4}\s[0-9]{4}'
+# Pattern: PAN (5 letters, 4 numbers, 1 letter); OCR may put spaces anywhere inside it,
+# but it must not start or end mid-word (e.g. "SHARMA 1990 A" is not a PAN)
+PAN_PATTERN = r'\b[A-Z](?:\s*[A-Z]){4}(?:\s*[0-9]){4}\s*[A-Z]\b'
+# Pattern: Pincode
+PINCODE_PATTERN = r'\b[1-9][0-9]{5}\b'
+
+# One pass per OCR block; m.lastgroup tells which field matched.
+# ASCII keeps \s/\b to ASCII classes; no nested quantifiers, so matching stays linear per block.
+COMBINED_ID_RE = re.compile(
+    rf'(?P<aadhar>{AADHAR_PATTERN})|(?P<pan>{PAN_PATTERN})|(?P<pin>{PINCODE_PATTERN})',
+    flags=re.ASCII
+)
+PINCODE_RE = re.compile(PINCODE_PATTERN, flags=re.ASCII)
+
+# Static parts of the Golden Record prompt, shared byte-for-byte across calls
+_PROMPT_HEADER = """Act as a Senior AI Solutions Architect. Create a consolidated JSON 'Golden Record' for a candidate.
+
+Data Sources:
+"""
+
+_RULES_BLOCK = """Conflict Resolution Rules:
+- Identity (Name, ID Numbers): Prioritize [ID Card Data] (especially Aadhar/PAN).
+- Current Status (Availability, Current Job): Prioritize [HR Transcript].
+- Employment/Education History: Prioritize [Resume].
+- Contact Info: Prioritize [Onboarding Form Data] if available, else Resume.
+
+"""
+
+_SCHEMA_BLOCK = """Output Schema:
+The output must be a single valid JSON object with the following structure:
+{
+  "personal_details": {
+    "name": "...",
+    "email": "...",
+    "phone": "...",
+    "id_type": "...",
+    "id_number": "...",
+    "address": "...",
+    "pincode": "..."
+  },
+  "education": [
+    { "institution": "...", "degree": "...", "year": "...", "score": "..." }
+  ],
+  "employment": [
+    { "company": "...", "role": "...", "start_date": "...", "end_date": "..." }
+  ],
+  "metadata": {
+    "sources_verified": ["Resume", "ID_Card", "Transcript", "Form"]
+  }
+}
+
+Constraint: Output ONLY valid JSON.
+"""
+
+def extract_id_fields(ocr_batch):
     """
-    Logic-based filter to isolate Aadhar and Pincode from OCR blocks.
+    Logic-based filter to isolate Aadhar and Pincode from OCR blocks (an OcrBatch).
     """
-    # Pattern: 12 digits, can have spaces (Aadhar)
-    aadhar_pattern = r'[2-9][0-9]{3}\s[0-9]{4}\s[0-9]{4}'
-    # Pattern: PAN (5 letters, 4 numbers, 1 letter)
-    pan_pattern = r'[A-Z]{5}[0-9]{4}[A-Z]{1}'
-    # Pattern: Pincode
-    pincode_pattern = r'\b[1-9][0-9]{5}\b'
-    
     extracted = {"id_type": None, "id_number": None, "pincode": None}
     max_id_height = 0  # To track the largest (boldest) ID number
     
-    print("\n--- Starting OCR Data Extraction Log (Size/Bold Logic) ---")
-    for i, (bbox, text, prob) in enumerate(ocr_results):
+    logger.debug("--- Starting OCR Data Extraction Log (Size/Bold Logic) ---")
+    heights = ocr_batch.heights
+    # Tallest blocks first, so the first ID match is also the boldest; shorter than 6 chars can't match
+    for i in ocr_batch.candidate_order(min_len=6):
+        text, prob, height = ocr_batch.texts[i], ocr_batch.probs[i], heights[i]
         # Clean text: strip spaces and convert to uppercase for PAN matching
         clean_text_raw = text.strip()
-        clean_text_upper = clean_text_raw.upper().replace(" ", "")
-        
-        # Calculate Height
-        height = abs(bbox[2][1] - bbox[1][1])
         
         # Log every block processed
-        print(f"Block {i}: '{clean_text_raw}' (H: {height:.2f}, Conf: {prob:.2f})")
-        
-        # 1. Check for Aadhar (12 digits, spaces allowed)
-        if re.search(aadhar_pattern, clean_text_raw):
-            print(f"   >>> POTENTIAL AADHAR: {clean_text_raw} | Height: {height:.2f}")
-            if height > max_id_height:
-                extracted["id_type"] = "Aadhar"
-                extracted["id_number"] = clean_text_raw
-                max_id_height = height
-                print(f"       >>> UPDATING CANDIDATE (New Max Height: {max_id_height:.2f})")
+        logger.debug("Block %d: %r (H: %.2f, Conf: %.2f)", i, clean_text_raw, height, prob)
         
-        # 2. Check for PAN (10 chars, no spaces)
-        elif re.match(pan_pattern, clean_text_upper): # Use match or search, clean_text_upper has no spaces
-             # If using search on raw text, regex needs to allow spaces? usually PAN is one block.
-             # Better to check clean_text_upper for the pattern [A-Z]{5}[0-9]{4}[A-Z]
-             
-             # Re-checking regex on clean_text_upper
-             if re.search(pan_pattern, clean_text_upper):
-                print(f"   >>> POTENTIAL PAN: {clean_text_upper} | Height: {height:.2f}")
+        for m in COMBINED_ID_RE.finditer(clean_text_raw.upper()):
+            field = m.lastgroup
+
+            # 1. Aadhar (12 digits, spaces allowed) / 2. PAN (10 chars): keep the tallest (boldest)
+            if field in ("aadhar", "pan"):
+                id_type = "Aadhar" if field == "aadhar" else "PAN"
+                id_number = clean_text_raw if field == "aadhar" else "".join(m.group().split())
+                logger.debug("   >>> POTENTIAL %s: %s | Height: %.2f", id_type.upper(), id_number, height)
                 if height > max_id_height:
-                    extracted["id_type"] = "PAN"
-                    extracted["id_number"] = clean_text_upper
+                    extracted["id_type"] = id_type
+                    extracted["id_number"] = id_number
                     max_id_height = height
-                    print(f"       >>> UPDATING CANDIDATE (New Max Height: {max_id_height:.2f})")
+                    logger.debug("       >>> UPDATING CANDIDATE (New Max Height: %.2f)", max_id_height)
+
+        # Blocks arrive tallest first, so once an ID is found no later block can replace it
+        if extracted["id_number"]:
+            break
 
-        # 3. Check for Pincode
-        if re.search(pincode_pattern, clean_text_raw) and len(clean_text_raw) == 6:
+    # 3. Pincode, only when it is the whole block; the last one in reading order wins
+    for text in reversed(ocr_batch.texts):
+        clean_text_raw = text.strip()
+        if len(clean_text_raw) == 6 and PINCODE_RE.search(clean_text_raw):
             extracted["pincode"] = clean_text_raw
-            print(f"   >>> MATCH FOUND: Pincode -> {extracted['pincode']}")
+            logger.debug("   >>> MATCH FOUND: Pincode -> %s", extracted["pincode"])
+            break
             
-    print("--- Final Extracted ID Data ---")
-    print(json.dumps(extracted, indent=4))
-    print("----------------------------------------\n")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("--- Final Extracted ID Data ---\n%s", json.dumps(extracted, indent=4))
     return extracted
 
+def extract_id_card_and_fields(image_path, raise_errors=False):
+    """
+    Runs OCR on an ID card and isolates its Aadhar/PAN and Pincode in one step.
+    Only the small field dict leaves this call (and the OCR worker process), not the OCR blocks.
+    With raise_errors, an OCR failure raises OcrError instead of yielding empty fields.
+    """
+    return extract_id_fields(extract_id_card_data(image_path, raise_errors=raise_errors))
+
+def _golden_record_inputs(resume_text, transcript_text, id_data, form_data):
+    """
+    Serializes the structured inputs and derives the cache key for them.
+    """
+    id_json = orjson.dumps(id_data, option=orjson.OPT_SORT_KEYS).decode() if id_data else 'None'
+    form_json = orjson.dumps(form_data, option=orjson.OPT_SORT_KEYS).decode() if form_data else 'None'
+
+    # A JSON array keeps field boundaries unambiguous ("A|B" + "C" must not collide with "A" + "B|C")
+    key = hashlib.sha256(
+        orjson.dumps([resume_text or "", transcript_text or "", id_json, form_json])
+    ).hexdigest()
+    return key, id_json, form_json
+
+def _cached_golden_record(key):
+    """
+    Returns the cached Golden Record for key (marking it recently used), or None.
+    """
+    with _golden_record_lock:
+        golden_record = _golden_record_cache.get(key)
+        if golden_record is not None:
+            _golden_record_cache.move_to_end(key)
+        return golden_record
+
+def _cache_golden_record(key, golden_record):
+    with _golden_record_lock:
+        _golden_record_cache[key] = golden_record
+        if len(_golden_record_cache) > _GOLDEN_RECORD_CACHE_SIZE:
+            _golden_record_cache.popitem(last=False)
+
 def extract_candidate_data(resume_text, transcript_text, id_data=None, form_data=None):
     """
     Combines OCR extracted ID data, Resume, Transcript, and Form Data into a detailed Golden Record.
+    Identical inputs are served from an in-process cache instead of re-calling the LLM.
+    """
+    key, id_json, form_json = _golden_record_inputs(resume_text, transcript_text, id_data, form_data)
+    golden_record = _cached_golden_record(key)
+    if golden_record is not None:
+        return golden_record
+
+    # Non-streaming, so Groq's JSON mode can enforce the output format
+    completion = _golden_record_completion(resume_text, transcript_text, id_json, form_json, stream=False)
+    golden_record = completion.choices[0].message.content
+    _cache_golden_record(key, golden_record)
+    return golden_record
+
+def stream_candidate_data(resume_text, transcript_text, id_data=None, form_data=None):
+    """
+    Streaming variant of extract_candidate_data for the UI: yields the Golden Record as it is generated.
+    """
+    key, id_json, form_json = _golden_record_inputs(resume_text, transcript_text, id_data, form_data)
+    golden_record = _cached_golden_record(key)
+    if golden_record is not None:
+        yield golden_record
+        return
+
+    parts = []
+    for chunk in _golden_record_completion(resume_text, transcript_text, id_json, form_json, stream=True):
+        token = chunk.choices[0].delta.content or ""
+        parts.append(token)
+        yield token
+
+    # JSON mode isn't available when streaming, so only a reply that parses is cached (without any wrapping)
+    golden_record = _extract_json_object("".join(parts))
+    try:
+        orjson.loads(golden_record)
+    except orjson.JSONDecodeError:
+        return
+    _cache_golden_record(key, golden_record)
+
+def _extract_json_object(text):
+    """
+    Returns the outermost {...} of an LLM reply, dropping a code fence or preamble around it.
+    """
+    start, end = text.find("{"), text.rfind("}")
+    return text[start:end + 1] if start != -1 and end > start else text
+
+def parse_golden_record(golden_record_str):
+    """
+    Parses a Golden Record reply; a streamed one may be wrapped in a code fence or preamble.
+    Raises orjson.JSONDecodeError if no valid JSON object is found.
+    """
+    return orjson.loads(_extract_json_object(golden_record_str))
+
+def _golden_record_completion(resume_text, transcript_text, id_json, form_json, stream):
+    """
+    Calls Groq to build the Golden Record from the already-serialized inputs.
+    Groq's JSON mode doesn't support streaming, so it is only requested for the non-streaming call;
+    the streamed reply relies on the prompt's JSON-only constraint and is parsed by the caller.
     """
     api_key = os.getenv("GROQ_API_KEY")
     client = Groq(api_key=api_key)
 
-    prompt = f"""
-    Act as a Senior AI Solutions Architect. Create a consolidated JSON 'Golden Record' for a candidate.
-    
-    Data Sources:
-    1. [Resume] (Source: OCR)
-    {resume_text}
-    
-    2. [ID Card Data] (Source: Spatial OCR)
-    {json.dumps(id_data) if id_data else 'None'}
-    
-    3. [Onboarding Form Data] (Source: User Input)
-    {json.dumps(form_data) if form_data else 'None'}
-    
-    4. [HR Transcript] (Source: Uploaded File)
-    {transcript_text}
-
-    Conflict Resolution Rules:
-    - Identity (Name, ID Numbers): Prioritize [ID Card Data] (especially Aadhar/PAN).
-    - Current Status (Availability, Current Job): Prioritize [HR Transcript].
-    - Employment/Education History: Prioritize [Resume].
-    - Contact Info: Prioritize [Onboarding Form Data] if available, else Resume.
-
-    Output Schema:
-    The output must be a single valid JSON object with the following structure:
-    {{
-      "personal_details": {{
-        "name": "...",
-        "email": "...",
-        "phone": "...",
-        "id_type": "...",
-        "id_number": "...",
-        "address": "...",
-        "pincode": "..."
-      }},
-      "education": [
-        {{ "institution": "...", "degree": "...", "year": "...", "score": "..." }}
-      ],
-      "employment": [
-        {{ "company": "...", "role": "...", "start_date": "...", "end_date": "..." }}
-      ],
-      "metadata": {{
-        "sources_verified": ["Resume", "ID_Card", "Transcript", "Form"]
-      }}
-    }}
-    
-    Constraint: Output ONLY valid JSON.
-    """
+    # Only the four data sources vary between calls; the surrounding blocks are module constants
+    prompt = "".join([
+        _PROMPT_HEADER,
+        "1. [Resume] (Source: OCR)\n", resume_text or "",
+        "\n\n2. [ID Card Data] (Source: Spatial OCR)\n", id_json,
+        "\n\n3. [Onboarding Form Data] (Source: User Input)\n", form_json,
+        "\n\n4. [HR Transcript] (Source: Uploaded File)\n", transcript_text or "",
+        "\n\n", _RULES_BLOCK, _SCHEMA_BLOCK
+    ])
 
-    completion = client.chat.completions.create(
+    output_options = {"stream": True} if stream else {"response_format": {"type": "json_object"}}
+    return client.chat.completions.create(
         model="llama-3.3-70b-versatile",
         messages=[{"role": "user", "content": prompt}],
         temperature=0,
-        response_format={"type": "json_object"}
-    )
-
-    return completion.choices[0].message.content
\ No newline at end of file
+        **output_options
+    )
\ No newline at end of file
@@ -1,35 +1,74 @@
 import os
-import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, LongTable, TableStyle
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+import orjson
 from dotenv import load_dotenv
 from groq import Groq
 
 load_dotenv()
 
+# Discrepancy table layout (points)
+TABLE_COL_WIDTHS = [70, 100, 100, 70, 200]
+TABLE_CELL_PADDING = 12  # default 6pt left + right
+TABLE_ROW_HEIGHT = 18  # one line of 10pt Helvetica plus default top/bottom padding
+MAX_CELL_CHARS = 300
+
+# Built once at import; every report reuses the same stylesheet and table style
+_STYLES = getSampleStyleSheet()
+_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+_RISK_STYLES = {
+    risk: ParagraphStyle('Risk', parent=_STYLES['Heading2'], textColor=color)
+    for risk, color in (("LOW", "green"), ("MEDIUM", "orange"), ("HIGH", "red"))
+}
+
+# A 100-word summary doesn't need the 70B model, except when the candidate is HIGH risk
+SUMMARY_MODEL = "llama-3.1-8b-instant"
+HIGH_RISK_SUMMARY_MODEL = "llama-3.3-70b-versatile"
+
+# Sent first and byte-identical on every call so Groq can reuse its cached prefix
+EXECUTIVE_SUMMARY_INSTRUCTIONS = """Act as an HR Compliance Auditor.
+You will be given a candidate's Risk Level and the Validation Issues Detected.
+
+Task: Write a concise (max 100 words) executive summary advising the HR manager on whether to proceed with this candidate.
+Focus on data integrity. If Risk is HIGH, advise caution. If LOW, recommend proceeding.
+Tone: Professional, Objective."""
+
 def evaluate_risk(validation_report):
     """
     Determines Risk Level based on discrepancy counts.
     """
-    incorrect_count = 0
-    ambiguous_count = 0
+    counts = {"INCORRECT": 0, "AMBIGUOUS": 0}
     
     # Validation report is a dict of fields -> {status, ...}
     for field, data in validation_report.items():
-        if field == "temporal_consistency":
-            if data.get("status") == "INCORRECT":
-                incorrect_count += 1
-            continue
-            
-        status = data.get("status")
-        if status == "INCORRECT":
-            incorrect_count += 1
-        elif status == "AMBIGUOUS":
-            ambiguous_count += 1
+        _count_risk(field, data.get("status"), counts)
             
+    return _risk_level(counts)
+
+def _count_risk(field, status, counts):
+    """
+    Adds one field's status to the INCORRECT / AMBIGUOUS counts behind the risk level.
+    """
+    # An ambiguous temporal check doesn't raise the risk
+    if status == "INCORRECT" or (status == "AMBIGUOUS" and field != "temporal_consistency"):
+        counts[status] += 1
+
+def _risk_level(counts):
+    incorrect_count, ambiguous_count = counts["INCORRECT"], counts["AMBIGUOUS"]
     if incorrect_count > 2:
         return "HIGH"
     elif incorrect_count >= 1 or ambiguous_count > 3:
@@ -37,10 +76,15 @@ def evaluate_risk(validation_report):
     else:
         return "LOW"
 
-def generate_executive_summary(validation_report, risk_level):
+def generate_executive_summary(validation_report, risk_level, model=None, issues=None):
     """
     Uses Groq to generate a professional HR summary.
+    Unless a model is given, HIGH risk summaries are escalated to the larger model, where the narrative matters most.
+    Callers that already filtered the INCORRECT/AMBIGUOUS fields can pass them as issues.
     """
+    if model is None:
+        model = HIGH_RISK_SUMMARY_MODEL if risk_level == "HIGH" else SUMMARY_MODEL
+
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         return "Error: GROQ_API_KEY not found."
@@ -48,97 +92,111 @@ def generate_executive_summary(validation_report, risk_level):
     client = Groq(api_key=api_key)
     
     # Filter only relevant issues for the prompt
-    issues = {k: v for k, v in validation_report.items() if v.get("status") in ["INCORRECT", "AMBIGUOUS"]}
-    
-    prompt = f"""
-    Act as an HR Compliance Auditor.
-    Risk Level: {risk_level}
+    if issues is None:
+        issues = {k: v for k, v in validation_report.items() if v.get("status") in {"INCORRECT", "AMBIGUOUS"}}
     
-    Validation Issues Detected:
-    {json.dumps(issues, indent=2)}
-    
-    Task: Write a concise (max 100 words) executive summary advising the HR manager on whether to proceed with this candidate. 
-    Focus on data integrity. If Risk is HIGH, advise caution. If LOW, recommend proceeding.
-    Tone: Professional, Objective.
-    """
+    # Only the candidate-specific data goes in the user message; the instructions are the fixed system prefix
+    prompt = f"""Risk Level: {risk_level}
+
+Validation Issues Detected:
+{orjson.dumps(issues, option=orjson.OPT_INDENT_2).decode()}
+"""
     
     try:
         completion = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
+            model=model,
+            messages=[
+                {"role": "system", "content": EXECUTIVE_SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": prompt}
+            ],
             temperature=0.5
         )
         return completion.choices[0].message.content
     except Exception as e:
         return f"Error generating summary: {e}"
 
+def _table_cell(text, col_width, style):
+    """
+    Truncates a discrepancy table cell and wraps it in a Paragraph only if it won't fit on one line.
+    """
+    if len(text) > MAX_CELL_CHARS:
+        text = text[:MAX_CELL_CHARS - 3] + "..."
+    # A plain string with a newline is drawn as several lines, which would overflow the fixed-height row
+    if "\n" not in text and stringWidth(text, style.fontName, style.fontSize) <= col_width - TABLE_CELL_PADDING:
+        return text
+    return Paragraph(text, style)
+
 def generate_pdf_report(validation_report, output_path):
     """
     Generates a PDF report using ReportLab.
     """
     doc = SimpleDocTemplate(output_path, pagesize=letter)
-    styles = getSampleStyleSheet()
+    styles = _STYLES
+    body_style = styles['BodyText']
     story = []
     
+    # Single pass over the report: risk counters, summary issues and discrepancy rows together
+    counts = {"INCORRECT": 0, "AMBIGUOUS": 0}
+    issues = {}
+    table_data = [["Field", "Candidate Claim", "Verified Truth", "Status", "Reasoning"]]
+    row_heights = [None]
+    
+    for field, data in validation_report.items():
+        status = data.get("status")
+        _count_risk(field, status, counts)
+        if status not in counts:
+            continue
+        issues[field] = data
+        
+        # Formatting for table (handle long text)
+        form_val = str(data.get("form_value", "N/A"))
+        kb_val = str(data.get("kb_value", "N/A"))
+        reason = str(data.get("reasoning", ""))
+        
+        # Plain strings when they fit on one line; Paragraph (which ReportLab has to measure) only to wrap
+        row = [
+            _table_cell(text, width, body_style)
+            for text, width in zip((field, form_val, kb_val, status, reason), TABLE_COL_WIDTHS)
+        ]
+        table_data.append(row)
+        # Fixed height for single-line rows so layout doesn't re-measure them; None lets wrapped rows size
+        row_heights.append(None if any(isinstance(cell, Paragraph) for cell in row) else TABLE_ROW_HEIGHT)
+    
+    risk = _risk_level(counts)
+    
+    # The summary's Groq call runs in the background while the rest of the story is laid out
+    executor = ThreadPoolExecutor(max_workers=1)
+    summary_future = executor.submit(generate_executive_summary, validation_report, risk, issues=issues)
+    executor.shutdown(wait=False)
+    
     # 1. Title
     story.append(Paragraph("Automated Candidate Onboarding Validation Report", styles['Title']))
     story.append(Spacer(1, 12))
     
     # 2. Risk Level
-    risk = evaluate_risk(validation_report)
-    risk_color = "green" if risk == "LOW" else "orange" if risk == "MEDIUM" else "red"
-    risk_style = ParagraphStyle('Risk', parent=styles['Heading2'], textColor=risk_color)
-    story.append(Paragraph(f"RISK ASSESSMENT: {risk}", risk_style))
+    story.append(Paragraph(f"RISK ASSESSMENT: {risk}", _RISK_STYLES[risk]))
     story.append(Spacer(1, 12))
     
-    # 3. Executive Summary
-    summary = generate_executive_summary(validation_report, risk)
-    story.append(Paragraph("Executive Summary", styles['Heading3']))
-    story.append(Paragraph(summary, styles['BodyText']))
-    story.append(Spacer(1, 24))
+    # 3. Executive Summary (inserted here once the LLM responds)
+    summary_index = len(story)
     
     # 4. Discrepancy Table
     story.append(Paragraph("Discrepancy Details (Incorrect / Ambiguous Fields)", styles['Heading3']))
     
-    table_data = [["Field", "Candidate Claim", "Verified Truth", "Status", "Reasoning"]]
-    
-    has_issues = False
-    for field, data in validation_report.items():
-        status = data.get("status")
-        if status in ["INCORRECT", "AMBIGUOUS"]:
-            has_issues = True
-            
-            # Formatting for table (handle long text)
-            form_val = str(data.get("form_value", "N/A"))
-            kb_val = str(data.get("kb_value", "N/A"))
-            reason = str(data.get("reasoning", ""))
-            
-            # Wrap text manually or let Paragraph handle it if we used Flowables in cells (advanced)
-            # For simplicity, just truncate if super long or rely on basic wrapping
-            table_data.append([
-                Paragraph(field, styles['BodyText']),
-                Paragraph(form_val, styles['BodyText']),
-                Paragraph(kb_val, styles['BodyText']),
-                Paragraph(status, styles['BodyText']),
-                Paragraph(reason, styles['BodyText'])
-            ])
-            
-    if has_issues:
-        t = Table(table_data, colWidths=[70, 100, 100, 70, 200])
-        t.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ]))
+    if issues:
+        t = LongTable(table_data, colWidths=TABLE_COL_WIDTHS, rowHeights=row_heights, repeatRows=1, splitByRow=1)
+        t.setStyle(_TABLE_STYLE)
         story.append(t)
     else:
-        story.append(Paragraph("No discrepancies found. All data verified successfully.", styles['BodyText']))
+        story.append(Paragraph("No discrepancies found. All data verified successfully.", body_style))
         
+    summary = summary_future.result()
+    story[summary_index:summary_index] = [
+        Paragraph("Executive Summary", styles['Heading3']),
+        Paragraph(summary, body_style),
+        Spacer(1, 24)
+    ]
+    
     # Build
     try:
         doc.build(story)
@@ -148,10 +206,18 @@ def generate_pdf_report(validation_report, output_path):
 
 # Backwards compatibility for main.py (Legacy)
 def generate_report(validation_json_str):
-    try:
-        report_data = json.loads(validation_json_str) 
-        # Just return the summary logic for legacy string output
-        risk = evaluate_risk(report_data)
-        return generate_executive_summary(report_data, risk)
-    except:
-        return "Error parsing validation JSON."
+    """
+    Accepts the validation report as a dict or a JSON string/bytes.
+    """
+    if isinstance(validation_json_str, dict):
+        report_data = validation_json_str
+    else:
+        try:
+            report_data = orjson.loads(validation_json_str)
+        except (ValueError, TypeError) as e:
+            return f"Error parsing validation JSON: {e}"
+        if not isinstance(report_data, dict):
+            return f"Error parsing validation JSON: expected an object, got {type(report_data).__name__}"
+    # Just return the summary logic for legacy string output
+    risk = evaluate_risk(report_data)
+    return generate_executive_summary(report_data, risk)
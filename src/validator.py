@@ -1,126 +1,291 @@
 import os
-import json
 import re
+import threading
+from collections import OrderedDict
 from datetime import datetime
 import numpy as np
+import orjson
 from dotenv import load_dotenv
 from groq import Groq
 
 # ONNX / Semantic Search Imports
-from optimum.onnxruntime import ORTModelForFeatureExtraction
+import onnxruntime as ort
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTOptimizer, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoOptimizationConfig, AutoQuantizationConfig
 from transformers import AutoTokenizer
-import torch
-import torch.nn.functional as F
 
 load_dotenv()
 
+MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+# ONNX export (graph-optimized) and its INT8 copy, written once and reused on later startups
+MODEL_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "onboard")
+OPTIMIZED_MODEL_DIR = os.path.join(MODEL_CACHE_DIR, "miniLM-onnx")
+OPTIMIZED_MODEL_FILE = "model_optimized.onnx"
+QUANTIZED_MODEL_DIR = os.path.join(MODEL_CACHE_DIR, "miniLM-onnx-int8")
+# ORTQuantizer names its output "<input stem>_quantized.onnx"
+QUANTIZED_MODEL_FILE = "model_optimized_quantized.onnx"
+
+# Binary synonym classification is well within the small, fast model
+SYNONYM_CHECK_MODEL = "llama-3.1-8b-instant"
+
+# Sent first and byte-identical on every call so Groq can reuse its cached prefix
+SYNONYM_CHECK_INSTRUCTIONS = """Act as a Data Validator.
+For each numbered pair of terms you are given, decide whether the two terms are effectively synonymous in an employment/education context.
+
+Reply strictly with JSON: {"results": [{"is_synonym": boolean, "reason": "short explanation"}, ...]}
+with exactly one result per pair, in the same order."""
+
+# Fields compared on their alphanumerics only, ignoring spaces/dashes/brackets
+IDENTIFIER_FIELDS = {"phone", "id_number"}
+_NON_ALNUM_RE = re.compile(r'[^0-9A-Za-z]')
+_WORD_RE = re.compile(r'\w+')
+
+# Cosine similarity at or above which a field is CORRECT / AMBIGUOUS (below both: INCORRECT)
+CORRECT_THRESHOLD = 0.9
+AMBIGUOUS_THRESHOLD = 0.7
+
+# 4096 x 384-dim float32 embeddings is ~6 MB
+EMBEDDING_CACHE_SIZE = 4096
+# Texts up to this many tokens (incl. [CLS]/[SEP]) are embedded apart from longer ones, so a stray address doesn't pad every name
+SHORT_BUCKET_TOKENS = 16
+
+# Extremely naive date parser for demo: looks for 4 digits
+_YEAR_RE = re.compile(r'\d{4}')
+
+def _parse_year(date_str):
+    match = _YEAR_RE.search(str(date_str))
+    return int(match.group(0)) if match else None
+
 class SemanticValidator:
     def __init__(self):
         print("Loading ONNX-optimized Sentence Transformer (all-MiniLM-L6-v2)...")
-        # Load model from HuggingFace and export to ONNX on the fly (or load cached)
-        self.tokenizer = AutoTokenizer.from_pretrained("sentence-transformers/all-MiniLM-L6-v2")
-        self.model = ORTModelForFeatureExtraction.from_pretrained(
-            "sentence-transformers/all-MiniLM-L6-v2", 
-            export=True  # This triggers ONNX export
-        )
+        self.tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
+        self.model = self._load_model()
         print("Model loaded successfully.")
         
-        self.groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+        # Normalized text -> embedding, least recently used first (lives as long as _validator_instance)
+        self._embedding_cache = OrderedDict()
+        # The instance is shared by concurrent Streamlit sessions
+        self._embedding_lock = threading.Lock()
+        
+        # Built on the first ambiguous pair; clean records never need the HTTP client
+        self.groq_client = None
+
+    def _load_model(self):
+        """
+        Loads the INT8-quantized ONNX model. The first run exports, graph-optimizes and quantizes it
+        once into ~/.cache/onboard; later startups only load the cached files.
+        """
+        quantized_path = os.path.join(QUANTIZED_MODEL_DIR, QUANTIZED_MODEL_FILE)
+        if os.path.exists(quantized_path):
+            return self._load_onnx(QUANTIZED_MODEL_DIR, QUANTIZED_MODEL_FILE)
 
-    def _mean_pooling(self, model_output, attention_mask):
-        token_embeddings = model_output[0] # First element of model_output contains all token embeddings
-        input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
-        return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(input_mask_expanded.sum(1), min=1e-9)
+        if not os.path.exists(os.path.join(OPTIMIZED_MODEL_DIR, OPTIMIZED_MODEL_FILE)):
+            # Load model from HuggingFace and export to ONNX (first run only)
+            print("Exporting and optimizing ONNX model (first run only)...")
+            model = ORTModelForFeatureExtraction.from_pretrained(
+                MODEL_ID, 
+                export=True  # This triggers ONNX export
+            )
+            # O3: fuses attention, layer-norm and GELU (approximated) kernels
+            optimizer = ORTOptimizer.from_pretrained(model)
+            optimizer.optimize(save_dir=OPTIMIZED_MODEL_DIR, optimization_config=AutoOptimizationConfig.O3())
+        model = self._load_onnx(OPTIMIZED_MODEL_DIR, OPTIMIZED_MODEL_FILE)
 
-    def get_embedding(self, text):
-        encoded_input = self.tokenizer([text], padding=True, truncation=True, return_tensors='pt')
-        with torch.no_grad():
-            model_output = self.model(**encoded_input)
+        try:
+            # Dynamic quantization: weights to int8 offline, activations quantized per batch at runtime
+            print("Quantizing ONNX model to INT8 (first run only)...")
+            quantizer = ORTQuantizer.from_pretrained(model)
+            qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+            quantizer.quantize(save_dir=QUANTIZED_MODEL_DIR, quantization_config=qconfig)
+        except Exception as e:
+            print(f"INT8 quantization failed, using FP32 model: {e}")
+            return model
         
-        # Perform pooling
-        sentence_embeddings = self._mean_pooling(model_output, encoded_input['attention_mask'])
+        # Loaded outside the try: a missing or broken INT8 file is an error, not a silent FP32 fallback
+        if not os.path.exists(quantized_path):
+            raise FileNotFoundError(f"Quantizer did not write the expected model file: {quantized_path}")
+        return self._load_onnx(QUANTIZED_MODEL_DIR, QUANTIZED_MODEL_FILE)
+
+    def _load_onnx(self, model_dir, file_name):
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session_options.intra_op_num_threads = os.cpu_count() or 1
+        return ORTModelForFeatureExtraction.from_pretrained(
+            model_dir, file_name=file_name, export=False, session_options=session_options
+        )
+
+    def _mean_pooling(self, token_embeddings, attention_mask):
+        mask = attention_mask[..., None].astype(np.float32)
+        return (token_embeddings * mask).sum(1) / np.maximum(mask.sum(1), 1e-9)
+
+    def get_embeddings_batch(self, texts):
+        """
+        Embeds all texts, running a single tokenizer + ONNX forward pass for those not seen before.
+        Returns an (N, D) array.
+        """
+        # MiniLM's tokenizer is uncased, so the normalized text embeds identically
+        keys = [text.strip().lower() for text in texts]
+        # Hits are copied out under the lock, so another thread's eviction can't remove them mid-call
+        found = {}
+        with self._embedding_lock:
+            for key in keys:
+                if key in self._embedding_cache:
+                    self._embedding_cache.move_to_end(key)
+                    found[key] = self._embedding_cache[key]
         
-        # Normalize embeddings
-        sentence_embeddings = F.normalize(sentence_embeddings, p=2, dim=1)
-        return sentence_embeddings[0].numpy()
+        missing = list(dict.fromkeys(k for k in keys if k not in found))
+        if missing:
+            # The model runs outside the lock; other sessions can keep reading the cache meanwhile
+            computed = dict(zip(missing, self._embed(missing)))
+            found.update(computed)
+            with self._embedding_lock:
+                self._embedding_cache.update(computed)
+                while len(self._embedding_cache) > EMBEDDING_CACHE_SIZE:
+                    self._embedding_cache.popitem(last=False)
+        return np.stack([found[key] for key in keys])
 
-    def get_similarity_score(self, text1, text2):
+    def _embed(self, texts):
+        # Tokenize once unpadded, then pad short and long texts as separate batches
+        encoded = self.tokenizer(texts, truncation=True)
+        lengths = [len(ids) for ids in encoded['input_ids']]
+        short = [i for i, n in enumerate(lengths) if n <= SHORT_BUCKET_TOKENS]
+        long = [i for i, n in enumerate(lengths) if n > SHORT_BUCKET_TOKENS]
+        
+        order = []
+        buckets = []
+        for bucket in (short, long):
+            if not bucket:
+                continue
+            # NumPy inputs make ONNX Runtime hand back NumPy outputs, so no torch tensors are involved
+            encoded_input = self.tokenizer.pad(
+                [{key: encoded[key][i] for key in encoded} for i in bucket],
+                padding='longest', return_tensors='np'
+            )
+            model_output = self.model(**encoded_input, return_dict=True)
+            
+            # Perform pooling
+            buckets.append(self._mean_pooling(model_output.last_hidden_state, encoded_input['attention_mask']))
+            order.extend(bucket)
+        
+        # Back to the caller's order
+        sentence_embeddings = np.empty((len(texts), buckets[0].shape[1]), dtype=buckets[0].dtype)
+        sentence_embeddings[order] = np.concatenate(buckets)
+        
+        # Normalize embeddings (L2)
+        sentence_embeddings /= np.maximum(np.linalg.norm(sentence_embeddings, axis=1, keepdims=True), 1e-12)
+        return sentence_embeddings
+
+    def get_embedding(self, text):
+        return self.get_embeddings_batch([text])[0]
+
+    def _fast_path_score(self, text1, text2, field=None):
+        """
+        Triage: scores that need no embedding (missing value or normalized match); None otherwise.
+        """
         if not text1 or not text2:
             return 0.0
         
         # Direct normalized match optimization
         if text1.strip().lower() == text2.strip().lower():
             return 1.0
-
-        emb1 = self.get_embedding(text1)
-        emb2 = self.get_embedding(text2)
         
-        # Cosine Similarity
-        return float(np.dot(emb1, emb2))
+        # Phone / ID numbers differ only in formatting ("+91-98765 43210", "2345 6789 0123")
+        if field in IDENTIFIER_FIELDS and _NON_ALNUM_RE.sub("", text1).lower() == _NON_ALNUM_RE.sub("", text2).lower():
+            return 1.0
+        return None
+
+    def get_similarity_scores(self, pairs, fields=None):
+        """
+        Cosine similarity for each (text1, text2) pair. Pairs that pass triage never reach the model;
+        the rest are embedded in one batch.
+        """
+        fields = fields or [None] * len(pairs)
+        scores = [self._fast_path_score(t1, t2, field) for (t1, t2), field in zip(pairs, fields)]
+        pending = [i for i, score in enumerate(scores) if score is None]
+        if pending:
+            texts = [t for i in pending for t in pairs[i]]
+            embeddings = self.get_embeddings_batch(texts)
+            # Rows alternate text1, text2: one row-wise dot product gives every cosine similarity
+            sims = np.einsum('ij,ij->i', embeddings[0::2], embeddings[1::2])
+            for i, sim in zip(pending, sims):
+                scores[i] = float(sim)
+        return scores
+
+    def get_similarity_score(self, text1, text2):
+        return self.get_similarity_scores([(text1, text2)])[0]
 
     def get_similarity_label(self, score):
-        if score >= 0.9:
-            return "CORRECT"
-        elif 0.7 <= score < 0.9:
-            return "AMBIGUOUS"
-        else:
-            return "INCORRECT"
+        return self.get_similarity_labels([score])[0]
+
+    def get_similarity_labels(self, scores):
+        """
+        Maps each similarity score to CORRECT / AMBIGUOUS / INCORRECT in one vectorized pass.
+        """
+        scores = np.asarray(scores)
+        return np.select(
+            [scores >= CORRECT_THRESHOLD, scores >= AMBIGUOUS_THRESHOLD], ["CORRECT", "AMBIGUOUS"], default="INCORRECT"
+        ).tolist()
 
     def llm_fallback_check(self, kb_val, form_val):
         """
         Uses Groq to verify if two ambiguous terms are actually synonyms.
         """
-        prompt = f"""
-        Act as a Data Validator.
-        Are these two terms effectively synonymous in an employment/education context?
-        Term 1: "{kb_val}"
-        Term 2: "{form_val}"
-        
-        Reply strictly with JSON: {{"is_synonym": boolean, "reason": "short explanation"}}
+        return self.llm_fallback_check_batch([(kb_val, form_val)])[0]
+
+    def llm_fallback_check_batch(self, pairs):
+        """
+        Checks every ambiguous (kb_val, form_val) pair for synonymy in a single Groq request.
+        Returns one {"is_synonym", "reason"} dict per pair, in order.
         """
+        # Only the pairs vary; the instructions are the fixed system prefix
+        prompt = "\n".join(
+            f'{i}. Term 1: "{kb_val}" | Term 2: "{form_val}"' for i, (kb_val, form_val) in enumerate(pairs, 1)
+        )
+        llm_error = {"is_synonym": False, "reason": "LLM Error"}
         try:
+            if self.groq_client is None:
+                self.groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
             completion = self.groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
+                model=SYNONYM_CHECK_MODEL,
+                messages=[
+                    {"role": "system", "content": SYNONYM_CHECK_INSTRUCTIONS},
+                    {"role": "user", "content": prompt}
+                ],
                 temperature=0,
                 response_format={"type": "json_object"}
             )
-            result = json.loads(completion.choices[0].message.content)
-            return result
+            results = orjson.loads(completion.choices[0].message.content).get("results", [])
+            if not isinstance(results, list):
+                raise ValueError(f"'results' is {type(results).__name__}, not a list")
         except Exception as e:
             print(f"LLM Fallback Error: {e}")
-            return {"is_synonym": False, "reason": "LLM Error"}
+            results = []
+        
+        # A short or malformed reply only fails the pairs it left out
+        results = [r if isinstance(r, dict) and "reason" in r else llm_error for r in results[:len(pairs)]]
+        return results + [llm_error] * (len(pairs) - len(results))
 
     def check_temporal_consistency(self, education_list, employment_list):
         """
         Ensures Graduation Year < Employment Start Date.
         Returns list of inconsistencies.
         """
-        issues = []
-        
-        # Helper to parse year/date
-        def parse_year(date_str):
-            # Extremely naive parser for demo: looks for 4 digits
-            match = re.search(r'\d{4}', str(date_str))
-            return int(match.group(0)) if match else None
-
         # Determine latest graduation year
-        latest_grad_year = 0
-        for edu in education_list:
-            grad_year = parse_year(edu.get('year') or edu.get('graduation_year'))
-            if grad_year and grad_year > latest_grad_year:
-                latest_grad_year = grad_year
+        grad_years = (_parse_year(edu.get('year') or edu.get('graduation_year')) for edu in education_list)
+        latest_grad_year = max((y for y in grad_years if y), default=0)
+        if not latest_grad_year:
+            return []
         
         # Check against employment start dates
-        for job in employment_list:
-            start_year = parse_year(job.get('start_date'))
-            if start_year and latest_grad_year and start_year < latest_grad_year:
-                # If started working BEFORE graduating, might be an internship, but flag it if not checking job title
-                # User Prompt: "strictly before any Employment Start Date" -> Assuming full-time?
-                # The rule is "Graduation Year is strictly before ANY Employment Start Date".
-                # But typically people have internships. 
-                # I'll flag it but maybe note if it looks like 'Intern'.
-                issues.append(f"Employment at '{job.get('company', 'Unknown')}' starts in {start_year}, which is before graduation in {latest_grad_year}.")
+        # If started working BEFORE graduating, might be an internship, but flag it if not checking job title
+        # The rule is "Graduation Year is strictly before ANY Employment Start Date".
+        start_years = [_parse_year(job.get('start_date')) for job in employment_list]
+        issues = [
+            f"Employment at '{job.get('company', 'Unknown')}' starts in {start_year}, which is before graduation in {latest_grad_year}."
+            for job, start_year in zip(employment_list, start_years)
+            if start_year and start_year < latest_grad_year
+        ]
         
         return issues
 
@@ -136,24 +301,19 @@ class SemanticValidator:
         
         # Heuristic 1: Short string is contained in first letters of words in Long string
         # e.g., TCET vs Thakur College of Engineering and Technology
-        long_words = re.findall(r'\w+', long_str)
-        initials = "".join([w[0] for w in long_words])
+        initials = "".join([w[0] for w in _WORD_RE.findall(long_str)])
         
         if short in initials:
             return True
+        
+        # Any character missing from the initials rules out heuristic 2 without scanning
+        if not set(short) <= set(initials):
+            return False
             
-        # Heuristic 2: All chars of short string appear in distinct words of long string in order
-        # Very loose check
-        s_idx, w_idx = 0, 0
-        while s_idx < len(short) and w_idx < len(long_words):
-            if long_words[w_idx].startswith(short[s_idx]):
-                s_idx += 1
-            w_idx += 1
-        
-        if s_idx == len(short):
-             return True
-             
-        return False
+        # Heuristic 2: All chars of short string appear in distinct words of long string in order,
+        # i.e. short is a subsequence of the initials. Very loose check
+        remaining = iter(initials)
+        return all(c in remaining for c in short)
 
     def validate(self, kb_json, form_json):
         report = {}
@@ -163,29 +323,23 @@ class SemanticValidator:
         form_pd = form_json.get("personal_details", {})
         
         fields_to_check = ["name", "email", "phone", "id_number"]
+        values = [(kb_pd.get(field, ""), form_pd.get(field, "")) for field in fields_to_check]
+        # Cast once; the raw values still go into the report
+        str_values = [(str(kb_val), str(form_val)) for kb_val, form_val in values]
         
-        for field in fields_to_check:
-            kb_val = kb_pd.get(field, "")
-            form_val = form_pd.get(field, "")
-            
-            score = self.get_similarity_score(str(kb_val), str(form_val))
-            status = self.get_similarity_label(score)
+        # One batched embedding pass for every field that isn't an exact match
+        scores = self.get_similarity_scores(str_values, fields=fields_to_check)
+        
+        labels = self.get_similarity_labels(scores)
+        
+        for field, (kb_val, form_val), (kb_s, form_s), score, status in zip(fields_to_check, values, str_values, scores, labels):
             reason = f"Similarity Score: {score:.2f}"
             
             # Check for Acronyms if score is low
-            if status == "INCORRECT" and self._is_acronym(str(kb_val), str(form_val)):
+            if status == "INCORRECT" and self._is_acronym(kb_s, form_s):
                 status = "AMBIGUOUS"
                 reason += " (Potential Acronym Detected)"
             
-            # Semantic / LLM Fallback for Ambiguous
-            if status == "AMBIGUOUS":
-                llm_check = self.llm_fallback_check(kb_val, form_val)
-                if llm_check.get("is_synonym"):
-                    status = "CORRECT"
-                    reason += f" (Verified by LLM: {llm_check['reason']})"
-                else:
-                    reason += f" (LLM rejected synonymy: {llm_check['reason']})"
-            
             report[field] = {
                 "status": status,
                 "score": score,
@@ -194,6 +348,20 @@ class SemanticValidator:
                 "reasoning": reason
             }
 
+        # Semantic / LLM Fallback for Ambiguous
+        # All ambiguous pairs share one Groq request; results are distributed back by index
+        ambiguous = [field for field in fields_to_check if report[field]["status"] == "AMBIGUOUS"]
+        if ambiguous:
+            llm_checks = self.llm_fallback_check_batch(
+                [(report[field]["kb_value"], report[field]["form_value"]) for field in ambiguous]
+            )
+            for field, llm_check in zip(ambiguous, llm_checks):
+                if llm_check.get("is_synonym"):
+                    report[field]["status"] = "CORRECT"
+                    report[field]["reasoning"] += f" (Verified by LLM: {llm_check['reason']})"
+                else:
+                    report[field]["reasoning"] += f" (LLM rejected synonymy: {llm_check['reason']})"
+
         # 2. Education Logic (Simplified: Check if Form Institution exists in KB)
         # For a robust system, we'd fuzzy match lists. 
         # Here we just verify the first item for demo purposes or check temporal logic.
@@ -224,15 +392,19 @@ class SemanticValidator:
 
 # Global instance for re-use if imported
 _validator_instance = None
+_validator_lock = threading.Lock()
 
 def validate_candidate_data(kb_json, form_json):
     global _validator_instance
+    # Double-checked so concurrent first requests don't each load an ONNX session
     if _validator_instance is None:
-        _validator_instance = SemanticValidator()
+        with _validator_lock:
+            if _validator_instance is None:
+                _validator_instance = SemanticValidator()
     
     # Parse JSONs if they are strings
-    if isinstance(kb_json, str): kb_json = json.loads(kb_json)
-    if isinstance(form_json, str): form_json = json.loads(form_json)
+    if isinstance(kb_json, (str, bytes)): kb_json = orjson.loads(kb_json)
+    if isinstance(form_json, (str, bytes)): form_json = orjson.loads(form_json)
         
     return _validator_instance.validate(kb_json, form_json)
 